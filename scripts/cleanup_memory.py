@@ -8,13 +8,18 @@ Usage:
 """
 
 import gc
+import os
 import sys
-import subprocess
 from pathlib import Path
 
 
 def cleanup_memory():
-    """Clear Python memory."""
+    """Clear Python memory.
+
+    Note: CUDA memory held by live model/tensor references cannot be
+    reclaimed here — set those references to None first. empty_cache() and
+    ipc_collect() only return already-freed cached blocks to the driver.
+    """
     print("Cleaning up Python memory...")
     gc.collect()
 
@@ -23,6 +28,7 @@ def cleanup_memory():
 
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
+            torch.cuda.ipc_collect()
             print("✓ Cleared CUDA cache")
     except ImportError:
         pass
@@ -31,27 +37,28 @@ def cleanup_memory():
 
 
 def kill_python_processes():
-    """Kill lingering Python processes (Windows only)."""
-    if sys.platform != "win32":
-        print("Process killing only supported on Windows")
+    """Kill lingering Python processes (excluding this one)."""
+    try:
+        import psutil
+    except ImportError:
+        print("Warning: psutil not installed - cannot kill processes")
+        print("Install with: pip install psutil")
         return
 
-    try:
-        print("\nKilling lingering Python processes...")
-        subprocess.run(
-            [
-                "powershell",
-                "-Command",
-                "Stop-Process -Name python -Force -ErrorAction SilentlyContinue",
-            ],
-            check=False,
-        )
-        import time
-
-        time.sleep(2)
-        print("✓ Processes terminated")
-    except Exception as e:
-        print(f"Warning: Could not kill processes: {e}")
+    print("\nKilling lingering Python processes...")
+    me = os.getpid()
+    killed = []
+    for proc in psutil.process_iter(["pid", "name"]):
+        name = proc.info["name"] or ""
+        if "python" in name.lower() and proc.info["pid"] != me:
+            try:
+                proc.kill()
+                killed.append(proc)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    psutil.wait_procs(killed, timeout=1)
+    print(f"✓ Terminated {len(killed)} process(es)")
 
 
 def main():
@@ -62,13 +69,12 @@ def main():
     cleanup_memory()
 
     # Ask before killing processes (or use --force flag)
-    if sys.platform == "win32":
-        if "--force" in sys.argv or "-f" in sys.argv:
+    if "--force" in sys.argv or "-f" in sys.argv:
+        kill_python_processes()
+    else:
+        response = input("\nKill lingering Python processes? [y/N]: ").lower()
+        if response == "y":
             kill_python_processes()
-        else:
-            response = input("\nKill lingering Python processes? [y/N]: ").lower()
-            if response == "y":
-                kill_python_processes()
 
     print("\n✓ Cleanup complete!")
     print("\nYou can now run training or detection commands.")
@@ -10,6 +10,7 @@ Usage:
 import os
 import shutil
 from pathlib import Path
+import numpy as np
 import rasterio
 from rasterio.windows import Window
 import geopandas as gpd
@@ -33,27 +34,38 @@ def create_sample_chm(
     """
     print(f"Creating sample CHM tile from {input_raster}...")
 
-    with rasterio.open(input_raster) as src:
+    # Raise the GDAL block cache above its 40 MB default and enable threaded
+    # compression — the window read on the large source CHM thrashes otherwise
+    with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS", GDAL_CACHEMAX=512), rasterio.open(
+        input_raster
+    ) as src:
         # Create window
         window = Window(start_x, start_y, tile_size, tile_size)
 
-        # Read data
-        data = src.read(window=window)
+        # Read only band 1 into a preallocated buffer of the source dtype —
+        # avoids rasterio's internal all-bands copy for the single-band CHM
+        out = np.empty((1, tile_size, tile_size), dtype=src.profile["dtype"])
+        src.read(indexes=[1], window=window, out=out)
 
-        # Update profile for output
+        # Update profile for output; internal tiling keeps downstream
+        # point/window reads at 256x256 blocks instead of whole-tile strips
         profile = src.profile.copy()
         profile.update(
             {
                 "height": tile_size,
                 "width": tile_size,
+                "count": 1,
                 "transform": rasterio.windows.transform(window, src.transform),
+                "tiled": True,
+                "blockxsize": 256,
+                "blockysize": 256,
             }
         )
 
         # Write output
         os.makedirs(os.path.dirname(output_raster), exist_ok=True)
         with rasterio.open(output_raster, "w", **profile) as dst:
-            dst.write(data)
+            dst.write(out)
 
         # Get file size
         size_mb = os.path.getsize(output_raster) / (1024 * 1024)
@@ -75,7 +87,7 @@ def copy_sample_labels(
     print(f"\nCopying sample labels from {input_gpkg}...")
 
     # Read labels
-    gdf = gpd.read_file(input_gpkg)
+    gdf = gpd.read_file(input_gpkg, engine="pyogrio")
 
     # Create output directory
     os.makedirs(os.path.dirname(output_gpkg), exist_ok=True)
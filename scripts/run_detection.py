@@ -23,15 +23,29 @@ def main():
     parser.add_argument("--output", required=True, help="Output GeoPackage path")
     parser.add_argument("--confidence", type=float, default=0.15, help="Confidence threshold")
     parser.add_argument("--min-area", type=float, default=0.5, help="Minimum area in m²")
-    parser.add_argument("--device", default="cpu", help="Device (cpu or cuda)")
+    parser.add_argument(
+        "--device", default="auto", help="Device ('cpu', 'cuda' or 'auto' to detect)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parallel worker processes for CPU inference (default: 1)",
+    )
 
     args = parser.parse_args()
 
+    if args.device == "auto":
+        import torch
+
+        args.device = "cuda" if torch.cuda.is_available() else "cpu"
+
     print(f"CDW Detection")
     print(f"  CHM: {args.chm}")
     print(f"  Model: {args.model}")
     print(f"  Output: {args.output}")
     print(f"  Confidence: {args.confidence}")
+    print(f"  Device: {args.device}")
     print()
 
     detector = CDWDetector(
@@ -39,6 +53,7 @@ def main():
         confidence=args.confidence,
         min_area_m2=args.min_area,
         device=args.device,
+        workers=args.workers,
     )
 
     detections = detector.detect(
@@ -12,9 +12,17 @@ Submodules:
 
 __version__ = "0.1.0"
 
-from .prepare import YOLODataPreparer
-from .detect import CDWDetector
-from .chm_variants import CHMVariantGenerator, CompositeGenerator, MaskedCHMGenerator
+# Public classes are resolved lazily (PEP 562) so that importing cdw_detect
+# does not pull in the heavy detect/prepare dependency chains (torch,
+# ultralytics, OpenCV) for scripts that never touch them — CLI startup for
+# non-ML tools drops from seconds to near-instant.
+_LAZY_IMPORTS = {
+    "YOLODataPreparer": "prepare",
+    "CDWDetector": "detect",
+    "CHMVariantGenerator": "chm_variants",
+    "CompositeGenerator": "chm_variants",
+    "MaskedCHMGenerator": "chm_variants",
+}
 
 __all__ = [
     "YOLODataPreparer",
@@ -24,3 +32,17 @@ __all__ = [
     "MaskedCHMGenerator",
     "__version__",
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    module = importlib.import_module(f".{module_name}", __name__)
+    return getattr(module, name)
+
+
+def __dir__():
+    return sorted(__all__)
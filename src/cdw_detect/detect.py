@@ -6,12 +6,34 @@ import numpy as np
 import rasterio
 from rasterio.windows import Window
 import geopandas as gpd
+import shapely
 from shapely.geometry import Polygon
 from shapely.strtree import STRtree
 import cv2
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 
+from ._kernels import normalize_tile
+
+# Per-process detector for parallel detection. Workers build their own model
+# (YOLO objects don't pickle) via the pool initializer and reuse it for all
+# tile batches they receive.
+_worker_detector = None
+
+
+def _init_detect_worker(init_kwargs):
+    global _worker_detector
+    _worker_detector = CDWDetector(**init_kwargs)
+
+
+def _detect_tiles_worker(args):
+    chm_path, offsets = args
+    return _worker_detector._detect_offsets(chm_path, offsets)
+
 
 class CDWDetector:
     """Detect coarse woody debris in CHM rasters using YOLO segmentation."""
@@ -25,6 +47,11 @@ class CDWDetector:
         iou_threshold: float = 0.5,
         min_area_m2: float = 0.5,
         device: str = "cpu",
+        workers: int = 1,
+        batch_size: int = 16,
+        half: bool = None,
+        int8: bool = False,
+        min_chm_height: float = 0.2,
     ):
         """
         Initialize detector.
@@ -37,6 +64,15 @@ class CDWDetector:
             iou_threshold: IoU threshold for NMS
             min_area_m2: Minimum detection area in m²
             device: Device to use ('cpu' or 'cuda')
+            workers: Number of parallel worker processes for CPU inference
+                (1 = run in-process; >1 splits the sliding window across a
+                process pool, each worker loading its own model)
+            batch_size: Number of tiles per YOLO forward pass (batching
+                amortizes per-call launch and Python overhead)
+            half: FP16 inference; None enables it automatically on CUDA
+            int8: Export the TensorRT engine with INT8 quantization (CUDA only)
+            min_chm_height: Tiles whose maximum valid CHM value is below this
+                (in m) are effectively bare ground and skip inference entirely
         """
         self.model_path = model_path
         self.tile_size = tile_size
@@ -45,6 +81,11 @@ class CDWDetector:
         self.iou_threshold = iou_threshold
         self.min_area_m2 = min_area_m2
         self.device = device
+        self.workers = workers
+        self.batch_size = batch_size
+        self.half = half
+        self.int8 = int8
+        self.min_chm_height = min_chm_height
 
         self._load_model()
 
@@ -62,6 +103,75 @@ class CDWDetector:
 
         self.model = YOLO(self.model_path)
 
+        # FP16 inference halves tensor bandwidth on GPU; no effect on CPU
+        on_cuda = str(self.device).startswith("cuda")
+        if self.half is None:
+            self.half = on_cuda
+
+        if on_cuda:
+            # Every tile is exactly tile_size x tile_size, so letting cuDNN
+            # benchmark its algorithms once is pure win — no shape churn
+            torch.backends.cudnn.benchmark = True
+
+            used_engine = False
+            if str(self.model_path).endswith(".pt"):
+                used_engine = self._load_tensorrt_engine()
+
+            if not used_engine:
+                # Graph-capture the backbone when TensorRT is unavailable;
+                # reduce-overhead amortizes kernel-launch cost at batch
+                # inference, fullgraph=False tolerates ultralytics' control flow
+                try:
+                    self.model.model = torch.compile(
+                        self.model.model, mode="reduce-overhead", fullgraph=False
+                    )
+                except Exception as e:
+                    print(f"Warning: torch.compile failed ({e}) - using eager model")
+
+            # Warmup pass so cuDNN autotuning / compilation happen here, not
+            # inside the first timed tile batch
+            warmup = np.zeros((self.tile_size, self.tile_size, 3), dtype=np.uint8)
+            self.model.predict(warmup, device=self.device, verbose=False)
+
+    def _load_tensorrt_engine(self) -> bool:
+        """Export the model to a TensorRT engine (once) and reload from it.
+
+        The engine runs roughly twice as fast as eager PyTorch on GPU at a
+        fraction of the memory. It is cached next to the .pt, keyed by image
+        size, batch size and precision, so the export cost is paid only when
+        one of those changes. Any export failure (no TensorRT install, laptop
+        GPU, ...) falls back to the PyTorch model with a warning.
+        """
+        from ultralytics import YOLO
+
+        model_path = Path(self.model_path)
+        tag = f"{self.tile_size}x{self.batch_size}"
+        if self.int8:
+            tag += "_int8"
+        elif self.half:
+            tag += "_half"
+        engine_path = model_path.with_name(f"{model_path.stem}_{tag}.engine")
+
+        try:
+            if not engine_path.exists():
+                exported = self.model.export(
+                    format="engine",
+                    imgsz=self.tile_size,
+                    device=self.device,
+                    half=self.half and not self.int8,
+                    int8=self.int8,
+                    dynamic=True,
+                    batch=self.batch_size,
+                    workspace=4,
+                )
+                Path(exported).rename(engine_path)
+            self.model = YOLO(str(engine_path))
+            print(f"Using TensorRT engine: {engine_path.name}")
+            return True
+        except Exception as e:
+            print(f"Warning: TensorRT export failed ({e}) - using PyTorch model")
+            return False
+
     def detect(self, chm_path: str, output_path: str = None) -> gpd.GeoDataFrame:
         """
         Run detection on a CHM raster.
@@ -73,159 +183,390 @@ class CDWDetector:
         Returns:
             GeoDataFrame with detected CDW polygons
         """
-        detections = []
-
         with rasterio.open(chm_path) as src:
             crs = src.crs or "EPSG:3301"
-            transform = src.transform
             width, height = src.width, src.height
-            nodata = src.nodata or -9999.0
+            pixel_size = src.transform.a
 
             # Calculate tiles
             n_cols = max(1, (width - self.tile_size) // self.stride + 1)
             n_rows = max(1, (height - self.tile_size) // self.stride + 1)
-            total = n_cols * n_rows
 
-            pbar = tqdm(total=total, desc="Detecting")
+        offsets = [
+            (
+                min(row * self.stride, height - self.tile_size),
+                min(col * self.stride, width - self.tile_size),
+            )
+            for row in range(n_rows)
+            for col in range(n_cols)
+        ]
 
-            for row in range(n_rows):
-                for col in range(n_cols):
-                    row_off = min(row * self.stride, height - self.tile_size)
-                    col_off = min(col * self.stride, width - self.tile_size)
+        if self.workers > 1 and len(offsets) > 1:
+            detections = self._detect_parallel(chm_path, offsets)
+        else:
+            detections = self._detect_offsets(chm_path, offsets, progress=True)
 
-                    # Read tile
-                    window = Window(col_off, row_off, self.tile_size, self.tile_size)
-                    tile = src.read(1, window=window)
+        if not detections:
+            print("No detections found")
+            return gpd.GeoDataFrame(columns=["geometry", "confidence", "area_m2"], crs=crs)
 
-                    # Handle nodata
-                    nodata_mask = np.isnan(tile) | (tile == nodata) | (tile < 0)
-                    if nodata_mask.sum() / nodata_mask.size > 0.5:
-                        pbar.update(1)
-                        continue
+        # Create GeoDataFrame
+        gdf = gpd.GeoDataFrame(detections, crs=crs)
 
-                    # Normalize
-                    tile_clean = tile.copy()
-                    tile_clean[nodata_mask] = 0
-                    valid = tile_clean[~nodata_mask]
+        # Apply NMS across tiles
+        gdf = self._apply_nms(gdf)
 
-                    if len(valid) == 0 or valid.max() <= valid.min():
-                        pbar.update(1)
-                        continue
+        # Simplify survivors in one vectorized pass at half-pixel tolerance;
+        # doing it after NMS skips the work for every suppressed polygon.
+        # Topology must be preserved: plain Douglas-Peucker can produce
+        # self-intersecting rings that break the length/perimeter metrics
+        # and the GeoPackage write below
+        gdf.geometry = shapely.simplify(
+            gdf.geometry.values, pixel_size * 0.5, preserve_topology=True
+        )
+
+        # Add metrics — vectorized shapely 2.x ufuncs over the geometry
+        # array; the .apply lambda crossed into Python once per polygon
+        geoms = gdf.geometry.values
+        gdf["length_m"] = shapely.length(geoms)
+        gdf["perimeter_m"] = shapely.length(shapely.get_exterior_ring(geoms))
+
+        # Save if path provided
+        if output_path:
+            gdf.to_file(output_path, driver="GPKG", engine="pyogrio")
+            print(f"Saved {len(gdf)} detections to {output_path}")
+
+        return gdf
+
+    def _detect_offsets(self, chm_path: str, offsets, progress: bool = False) -> list:
+        """Run detection over a list of (row_off, col_off) tile positions.
+
+        Tiles are normalized eagerly but run through the model in batches of
+        ``batch_size`` — one forward pass per batch instead of per tile, which
+        amortizes kernel-launch and framework overhead.
+
+        Reads are cached per tile row: one banded read decodes every raster
+        block of the row once, and the overlapping sliding-window tiles are
+        sliced out of the cached band instead of re-decompressing the overlap
+        for each windowed read.
+
+        Preprocessing runs in a background producer thread that deposits
+        ready batches into a size-2 queue, so the read/normalize work for
+        batch N+1 overlaps the model forward pass on batch N.
+        """
+        detections = []
+
+        # On CUDA, normalize on the GPU: the tile crosses PCIe once as a raw
+        # float32 buffer and the model consumes the on-device batch directly,
+        # skipping Ultralytics' CPU-side preprocessing.
+        use_gpu_preproc = str(self.device).startswith("cuda")
+
+        with rasterio.open(chm_path) as src:
+            transform = src.transform
+            nodata = src.nodata or -9999.0
+            width = src.width
 
-                    tile_norm = np.clip(
-                        (tile_clean - valid.min()) / (valid.max() - valid.min()), 0, 1
+            pbar = tqdm(total=len(offsets), desc="Detecting", disable=not progress)
+
+            # maxsize=2 keeps one batch in flight and one ready — enough to
+            # hide preprocessing without holding extra batches in memory
+            batch_q = queue.Queue(maxsize=2)
+
+            if use_gpu_preproc:
+                import torch
+
+                # Two pinned staging buffers, used round-robin: pinned pages
+                # make the host-to-device copy fast and the pair is allocated
+                # once instead of per tile
+                staging = [
+                    torch.empty(
+                        (self.tile_size, self.tile_size), dtype=torch.float32, pin_memory=True
                     )
-                    tile_img = (tile_norm * 255).astype(np.uint8)
-                    tile_img[nodata_mask] = 0
-                    tile_rgb = cv2.cvtColor(tile_img, cv2.COLOR_GRAY2RGB)
+                    for _ in range(2)
+                ]
+            else:
+                staging = None
+
+            producer_error = []
+            stop = threading.Event()
+
+            def producer():
+                band = None
+                band_row = None
+                batch_imgs = []
+                batch_offsets = []
+                n_staged = 0
+                try:
+                    for row_off, col_off in offsets:
+                        # Consumer failed: stop reading before the rasterio
+                        # dataset is torn down under us
+                        if stop.is_set():
+                            return
+                        # Slice the tile out of the cached row band
+                        if row_off != band_row:
+                            band = src.read(
+                                1, window=Window(0, row_off, width, self.tile_size)
+                            )
+                            band_row = row_off
+                        tile = band[:, col_off : col_off + self.tile_size]
+
+                        if use_gpu_preproc:
+                            img = self._normalize_tile_cuda(
+                                tile, nodata, staging=staging[n_staged % 2]
+                            )
+                            if img is None:
+                                pbar.update(1)
+                                continue
+                            n_staged += 1
+                        else:
+                            # Fused nodata masking + normalization (single
+                            # kernel pass)
+                            tile_img, nodata_frac, vmin, vmax = normalize_tile(tile, nodata)
+                            # vmax < min_chm_height means bare ground — no
+                            # log can be in the tile, so skip the forward pass
+                            if nodata_frac > 0.5 or vmax <= vmin or vmax < self.min_chm_height:
+                                pbar.update(1)
+                                continue
+                            img = cv2.cvtColor(tile_img, cv2.COLOR_GRAY2RGB)
+
+                        batch_imgs.append(img)
+                        batch_offsets.append((row_off, col_off))
+                        if len(batch_imgs) == self.batch_size:
+                            batch_q.put((batch_imgs, batch_offsets))
+                            batch_imgs = []
+                            batch_offsets = []
+                        pbar.update(1)
+
+                    if batch_imgs:
+                        batch_q.put((batch_imgs, batch_offsets))
+                except Exception as e:
+                    producer_error.append(e)
+                finally:
+                    batch_q.put(None)
+
+            producer_thread = threading.Thread(target=producer, daemon=True)
+            producer_thread.start()
+
+            try:
+                while True:
+                    item = batch_q.get()
+                    if item is None:
+                        break
+                    batch_imgs, batch_offsets = item
 
-                    # Run inference
+                    if use_gpu_preproc:
+                        import torch
+
+                        imgs = torch.stack(batch_imgs)
+                        if self.half:
+                            imgs = imgs.half()
+                    else:
+                        imgs = batch_imgs
                     results = self.model.predict(
-                        tile_rgb,
+                        imgs,
                         conf=self.confidence,
                         iou=self.iou_threshold,
                         verbose=False,
                         device=self.device,
+                        half=self.half,
                     )
+                    for result, (row_off, col_off) in zip(results, batch_offsets):
+                        detections.extend(
+                            self._result_to_detections(result, transform, row_off, col_off)
+                        )
+            except BaseException:
+                # Unblock a producer stuck on a full queue, wait for its
+                # sentinel and join before the dataset closes, then re-raise
+                stop.set()
+                while batch_q.get() is not None:
+                    pass
+                producer_thread.join()
+                raise
+
+            producer_thread.join()
+            pbar.close()
+            # A read/normalize failure in the producer must not look like a
+            # clean run with fewer tiles — surface it to the caller
+            if producer_error:
+                raise producer_error[0]
 
-                    # Process results
-                    if results and results[0].masks is not None:
-                        masks = results[0].masks.data.cpu().numpy()
-                        confs = results[0].boxes.conf.cpu().numpy()
+        return detections
 
-                        for i in range(len(masks)):
-                            mask = masks[i]
-                            conf = float(confs[i])
+    def _normalize_tile_cuda(self, tile, nodata, staging=None):
+        """Normalize a CHM tile on the GPU; returns a (3, H, W) float tensor.
 
-                            # Resize mask
-                            if mask.shape != (self.tile_size, self.tile_size):
-                                mask = cv2.resize(mask, (self.tile_size, self.tile_size))
+        Returns None for tiles the CPU path would skip (>50% nodata or no
+        valid contrast). When ``staging`` is given (a preallocated pinned
+        float32 tensor of tile shape), the host-to-device copy goes through
+        it — pinned transfers are faster and the buffer is reused instead of
+        allocated per tile.
+        """
+        import torch
 
-                            mask_binary = (mask > 0.5).astype(np.uint8)
-                            contours, _ = cv2.findContours(
-                                mask_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-                            )
+        if staging is not None:
+            staging.copy_(torch.from_numpy(np.ascontiguousarray(tile, dtype=np.float32)))
+            t = staging.to(self.device, non_blocking=True)
+        else:
+            t = torch.as_tensor(tile, device=self.device).float()
+        mask = torch.isnan(t) | (t == nodata) | (t < 0)
+        if mask.float().mean().item() > 0.5:
+            return None
+
+        valid = t[~mask]
+        if valid.numel() == 0:
+            return None
+        vmin, vmax = torch.aminmax(valid)
+        # Bare-ground early exit mirrors the CPU path: no valid pixel
+        # reaches min_chm_height, so nothing detectable is in the tile
+        if vmax.item() < self.min_chm_height or not (vmax > vmin).item():
+            return None
+
+        t = ((t - vmin) / (vmax - vmin)).clamp_(0, 1)
+        t[mask] = 0
+        return t.unsqueeze(0).expand(3, -1, -1)
+
+    def _result_to_detections(self, result, transform, row_off: int, col_off: int) -> list:
+        """Convert one YOLO result into georeferenced detection records."""
+        detections = []
 
-                            for contour in contours:
-                                if len(contour) < 3:
-                                    continue
-
-                                # Convert to geo coordinates
-                                geo_coords = []
-                                for pt in contour:
-                                    px, py = pt[0]
-                                    geo_x = transform.c + (col_off + px) * transform.a
-                                    geo_y = transform.f + (row_off + py) * transform.e
-                                    geo_coords.append((geo_x, geo_y))
-
-                                if len(geo_coords) < 3:
-                                    continue
-
-                                try:
-                                    poly = Polygon(geo_coords)
-                                    if poly.area >= self.min_area_m2:
-                                        detections.append(
-                                            {
-                                                "geometry": poly.simplify(transform.a * 0.5),
-                                                "confidence": conf,
-                                                "area_m2": poly.area,
-                                            }
-                                        )
-                                except:
-                                    continue
-
-                    pbar.update(1)
+        if result.masks is None:
+            return detections
 
-            pbar.close()
+        # Hoist Affine attribute lookups out of the per-contour loop —
+        # they go through namedtuple indexing on every access
+        tc, ta, tf, te = transform.c, transform.a, transform.f, transform.e
 
-        if not detections:
-            print("No detections found")
-            return gpd.GeoDataFrame(columns=["geometry", "confidence", "area_m2"], crs=crs)
+        import torch
+        import torch.nn.functional as F
+
+        # Resize all masks with one batched interpolate and threshold to
+        # uint8 while still on-device — K separate cv2.resize calls become a
+        # single kernel, and the host transfer shrinks to 1 byte per pixel
+        masks_t = result.masks.data
+        if masks_t.shape[-2:] != (self.tile_size, self.tile_size):
+            masks_t = F.interpolate(
+                masks_t.unsqueeze(1).float(),
+                size=(self.tile_size, self.tile_size),
+                mode="bilinear",
+                align_corners=False,
+            ).squeeze(1)
+        # contiguous() guarantees every masks[i] slice is C-contiguous, so
+        # cv2.findContours never triggers an implicit per-mask copy; confs
+        # come over as float32 in one transfer rather than one sync per box
+        masks = (masks_t > 0.5).to(torch.uint8).contiguous().cpu().numpy()
+        confs = result.boxes.conf.to(torch.float32).contiguous().cpu().numpy()
+
+        for i in range(len(masks)):
+            mask_binary = masks[i]
+            conf = float(confs[i])
+
+            contours, _ = cv2.findContours(
+                mask_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+            )
+
+            for contour in contours:
+                if len(contour) < 3:
+                    continue
 
-        # Create GeoDataFrame
-        gdf = gpd.GeoDataFrame(detections, crs=crs)
+                # Convert to geo coordinates — vectorized affine over the
+                # whole (N, 2) contour instead of a per-point Python loop
+                pts = contour[:, 0, :].astype(np.float64)
+                geo_coords = np.empty_like(pts)
+                geo_coords[:, 0] = tc + (col_off + pts[:, 0]) * ta
+                geo_coords[:, 1] = tf + (row_off + pts[:, 1]) * te
+
+                try:
+                    poly = Polygon(geo_coords)
+                    if poly.area >= self.min_area_m2:
+                        detections.append(
+                            {
+                                "geometry": poly,
+                                "confidence": conf,
+                                "area_m2": poly.area,
+                            }
+                        )
+                except:
+                    continue
 
-        # Apply NMS across tiles
-        gdf = self._apply_nms(gdf)
+        return detections
 
-        # Add metrics
-        gdf["length_m"] = gdf.geometry.length
-        gdf["perimeter_m"] = gdf.geometry.apply(lambda g: g.exterior.length)
+    def _detect_parallel(self, chm_path: str, offsets) -> list:
+        """Split tile positions across a process pool of single-threaded detectors.
 
-        # Save if path provided
-        if output_path:
-            gdf.to_file(output_path, driver="GPKG")
-            print(f"Saved {len(gdf)} detections to {output_path}")
+        Uses the 'spawn' start method — GDAL/rasterio objects are not
+        fork-safe — and one model load per worker via the pool initializer.
+        """
+        init_kwargs = {
+            "model_path": self.model_path,
+            "tile_size": self.tile_size,
+            "stride": self.stride,
+            "confidence": self.confidence,
+            "iou_threshold": self.iou_threshold,
+            "min_area_m2": self.min_area_m2,
+            "device": self.device,
+            "workers": 1,
+            "batch_size": self.batch_size,
+            "half": self.half,
+            "int8": self.int8,
+            "min_chm_height": self.min_chm_height,
+        }
+
+        # A few chunks per worker keeps the pool busy without paying
+        # per-tile task overhead. Contiguous runs (not strided) so each
+        # worker's tiles share rows and hit its row-band read cache.
+        n_chunks = min(len(offsets), self.workers * 4)
+        chunk_len = -(-len(offsets) // n_chunks)
+        chunks = [offsets[i : i + chunk_len] for i in range(0, len(offsets), chunk_len)]
 
-        return gdf
+        detections = []
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_detect_worker,
+            initargs=(init_kwargs,),
+        ) as pool:
+            tasks = [(chm_path, chunk) for chunk in chunks]
+            for result in tqdm(
+                pool.map(_detect_tiles_worker, tasks),
+                total=len(tasks),
+                desc="Detecting (parallel)",
+            ):
+                detections.extend(result)
+
+        return detections
 
     def _apply_nms(self, gdf: gpd.GeoDataFrame, iou_thresh: float = 0.4) -> gpd.GeoDataFrame:
-        """Apply non-maximum suppression across overlapping detections."""
+        """Apply non-maximum suppression across overlapping detections.
+
+        All candidate pairs come from one bulk STRtree query and their IoUs
+        from vectorized shapely 2 ops (union area = A + B - intersection, so
+        no second GEOS call); only the suppression decisions loop in Python,
+        over the overlapping pairs rather than n² combinations.
+        """
         if len(gdf) == 0:
             return gdf
 
-        tree = STRtree(gdf.geometry)
-        keep = set(range(len(gdf)))
-
-        for idx in range(len(gdf)):
-            if idx not in keep:
-                continue
+        geoms = gdf.geometry.values
+        confs = gdf["confidence"].values
 
-            candidates = list(tree.query(gdf.iloc[idx].geometry))
+        tree = STRtree(geoms)
+        pairs = tree.query(geoms, predicate="intersects").T
+        pairs = pairs[pairs[:, 0] < pairs[:, 1]]
 
-            for other_idx in candidates:
-                if other_idx == idx or other_idx not in keep:
-                    continue
+        keep = np.ones(len(gdf), dtype=bool)
+        if len(pairs):
+            inter = shapely.area(shapely.intersection(geoms[pairs[:, 0]], geoms[pairs[:, 1]]))
+            areas = shapely.area(geoms)
+            union = areas[pairs[:, 0]] + areas[pairs[:, 1]] - inter
+            iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
 
-                inter = gdf.iloc[idx].geometry.intersection(gdf.iloc[other_idx].geometry).area
-                union = gdf.iloc[idx].geometry.union(gdf.iloc[other_idx].geometry).area
-
-                if union > 0 and inter / union > iou_thresh:
+            for i, j in pairs[iou > iou_thresh]:
+                if keep[i] and keep[j]:
                     # Keep higher confidence
-                    if gdf.iloc[idx]["confidence"] > gdf.iloc[other_idx]["confidence"]:
-                        keep.discard(other_idx)
+                    if confs[i] > confs[j]:
+                        keep[j] = False
                     else:
-                        keep.discard(idx)
-                        break
+                        keep[i] = False
 
-        return gdf.iloc[list(keep)].reset_index(drop=True)
+        return gdf.iloc[np.flatnonzero(keep)].reset_index(drop=True)
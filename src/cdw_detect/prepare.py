@@ -9,10 +9,17 @@ from rasterio.windows import Window
 from rasterio.features import rasterize
 import geopandas as gpd
 from shapely.geometry import box, Polygon
+from shapely.strtree import STRtree
 import cv2
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
 from tqdm import tqdm
+
+from ._kernels import normalize_tile
 import csv
 
 
@@ -27,6 +34,7 @@ class YOLODataPreparer:
         overlap: float = 0.2,
         min_log_pixels: int = 50,
         val_split: float = 0.2,
+        use_raster_masks: bool = False,
     ):
         """
         Initialize the data preparer.
@@ -38,6 +46,9 @@ class YOLODataPreparer:
             overlap: Overlap fraction between tiles (0.2 = 20%)
             min_log_pixels: Minimum pixels for a valid log mask
             val_split: Fraction of data for validation
+            use_raster_masks: Use the legacy rasterize-then-findContours label
+                path instead of converting polygon exteriors directly (kept
+                for parity checks)
         """
         self.output_dir = Path(output_dir)
         self.tile_size = tile_size
@@ -45,6 +56,7 @@ class YOLODataPreparer:
         self.overlap = overlap
         self.min_log_pixels = min_log_pixels
         self.val_split = val_split
+        self.use_raster_masks = use_raster_masks
         self.metadata = []
 
         self._setup_directories()
@@ -90,7 +102,7 @@ class YOLODataPreparer:
 
         # Load data
         try:
-            labels_gdf = gpd.read_file(labels_path)
+            labels_gdf = gpd.read_file(labels_path, engine="pyogrio")
         except Exception as e:
             raise ValueError(f"Failed to read labels file: {e}")
 
@@ -133,35 +145,96 @@ class YOLODataPreparer:
             # Buffer lines to polygons
             labels_gdf["geometry"] = labels_gdf.geometry.buffer(self.buffer_width)
 
+            # Spatial pre-index over the buffered labels: candidate lookup per
+            # tile goes through the tree instead of a linear intersects() scan
+            # of every label polygon for every tile
+            label_geoms = labels_gdf.geometry.values
+            label_tree = STRtree(label_geoms)
+
             # Calculate tile positions
             stride = int(self.tile_size * (1 - self.overlap))
             n_cols = max(1, (width - self.tile_size) // stride + 1)
             n_rows = max(1, (height - self.tile_size) // stride + 1)
 
-            # Process tiles
+            # Process tile rows in parallel. Each worker reuses a thread-local
+            # dataset handle (rasterio handles are not thread-safe across
+            # reads) and its own banded row read; rasterio, GEOS and OpenCV
+            # all release the GIL, so the reads, rasterize and PNG encodes of
+            # different rows overlap. Shared state is updated under a lock.
             stats = {"total": 0, "with_cdw": 0, "empty": 0, "skipped": 0}
             tile_idx = 0
 
-            for row in tqdm(range(n_rows), desc="Processing rows"):
+            tls = threading.local()
+            worker_handles = []
+            lock = threading.Lock()
+
+            # Dedicated writer threads drain a bounded queue so tile
+            # producers never block on disk stalls; compression level 1 —
+            # these are transient training tiles, encode speed beats size
+            writer_q = queue.Queue(maxsize=64)
+            writer_errors = []
+
+            def writer_loop():
+                while True:
+                    item = writer_q.get()
+                    try:
+                        if item is None:
+                            return
+                        if writer_errors:
+                            continue  # drain without writing once a write failed
+                        img_path, img, label_path, text = item
+                        cv2.imwrite(img_path, img, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                        with open(label_path, "w") as f:
+                            f.write(text)
+                    except Exception as e:
+                        writer_errors.append(e)
+                    finally:
+                        # Always mark the item done, even on a failed write —
+                        # otherwise writer_q.join() below would deadlock
+                        writer_q.task_done()
+
+            writer_threads = [
+                threading.Thread(target=writer_loop, daemon=True) for _ in range(2)
+            ]
+            for t in writer_threads:
+                t.start()
+
+            def process_row(row):
+                nonlocal tile_idx
+
+                handle = getattr(tls, "src", None)
+                if handle is None:
+                    handle = rasterio.open(chm_path)
+                    tls.src = handle
+                    with lock:
+                        worker_handles.append(handle)
+
+                row_off = row * stride
+                if row_off + self.tile_size > height:
+                    row_off = height - self.tile_size
+
+                # One banded read per tile row: decodes each raster block of
+                # the row once, then the overlapping tiles are sliced from the
+                # band instead of re-decompressing the overlap per window
+                band = handle.read(1, window=Window(0, row_off, width, self.tile_size))
+
                 for col in range(n_cols):
-                    row_off = row * stride
                     col_off = col * stride
 
                     # Clip to bounds
                     if col_off + self.tile_size > width:
                         col_off = width - self.tile_size
-                    if row_off + self.tile_size > height:
-                        row_off = height - self.tile_size
 
-                    # Read tile
                     window = Window(col_off, row_off, self.tile_size, self.tile_size)
-                    tile_data = src.read(1, window=window)
+                    tile_data = band[:, col_off : col_off + self.tile_size]
 
+                    # Fused nodata masking + normalization (single kernel pass).
                     # Skip tiles that are >95% nodata — raised from 0.5 to allow sparse ALS
                     # tiles where valid pixels cluster along scan lines, avoiding data loss
-                    nodata_mask = np.isnan(tile_data) | (tile_data == nodata) | (tile_data < 0)
-                    if nodata_mask.sum() / nodata_mask.size > 0.95:
-                        stats["skipped"] += 1
+                    tile_img, nodata_frac, _, _ = normalize_tile(tile_data, nodata)
+                    if nodata_frac > 0.95:
+                        with lock:
+                            stats["skipped"] += 1
                         continue
 
                     # Get tile bounds
@@ -169,28 +242,13 @@ class YOLODataPreparer:
                     tile_box = box(*tile_bounds)
 
                     # Find intersecting labels
-                    intersecting = labels_gdf[labels_gdf.intersects(tile_box)]
+                    hits = label_tree.query(tile_box, predicate="intersects")
 
                     # Create tile transform
                     tile_transform = rasterio.transform.from_bounds(
                         *tile_bounds, self.tile_size, self.tile_size
                     )
 
-                    # Normalize image
-                    tile_clean = tile_data.copy()
-                    tile_clean[nodata_mask] = 0
-                    valid = tile_clean[~nodata_mask]
-
-                    if len(valid) > 0 and valid.max() > valid.min():
-                        tile_norm = np.clip(
-                            (tile_clean - valid.min()) / (valid.max() - valid.min()), 0, 1
-                        )
-                        tile_img = (tile_norm * 255).astype(np.uint8)
-                    else:
-                        tile_img = np.zeros((self.tile_size, self.tile_size), dtype=np.uint8)
-
-                    tile_img[nodata_mask] = 0
-
                     # Determine split
                     split = "val" if np.random.random() < self.val_split else "train"
 
@@ -198,73 +256,137 @@ class YOLODataPreparer:
                     label_lines = []
                     has_cdw = False
 
-                    for _, label_row in intersecting.iterrows():
-                        geom = label_row.geometry.intersection(tile_box)
-                        if geom.is_empty:
-                            continue
+                    if not self.use_raster_masks:
+                        # Emit YOLO polygons straight from the clipped label
+                        # exteriors — the source geometry is already a polygon,
+                        # so the rasterize → findContours round-trip (one GDAL
+                        # call, one cv2 pass and a tile-sized buffer per label)
+                        # adds nothing but quantization.
+                        minx, miny, maxx, maxy = tile_bounds
+                        min_area = self.min_log_pixels * pixel_size * pixel_size
+
+                        for gid in hits:
+                            geom = label_geoms[gid].intersection(tile_box)
+                            if geom.is_empty:
+                                continue
+                            if geom.geom_type == "Polygon":
+                                polys = (geom,)
+                            elif hasattr(geom, "geoms"):
+                                polys = tuple(
+                                    g for g in geom.geoms if g.geom_type == "Polygon"
+                                )
+                            else:
+                                continue
+
+                            for poly in polys:
+                                if poly.area < min_area:
+                                    continue
+                                pts = np.asarray(poly.exterior.coords)[:-1]
+                                if len(pts) < 3:
+                                    continue
+
+                                # World → normalized tile coordinates (y down)
+                                norm = np.empty_like(pts)
+                                norm[:, 0] = (pts[:, 0] - minx) / (maxx - minx)
+                                norm[:, 1] = (maxy - pts[:, 1]) / (maxy - miny)
+                                np.clip(norm, 0.0, 1.0, out=norm)
+
+                                coords = " ".join(f"{x:.6f} {y:.6f}" for x, y in norm)
+                                label_lines.append(f"0 {coords}")
+                                has_cdw = True
 
-                        # Rasterize mask
-                        mask = rasterize(
-                            [(geom, 1)],
+                        shapes = []
+                    else:
+                        # Clip the hits and rasterize them in a single GDAL
+                        # pass with distinct burn values; per-label masks fall
+                        # out by equality. One rasterizer launch and one buffer
+                        # instead of K. (Overlapping buffers burn last-wins,
+                        # which only matters where two logs cross.)
+                        shapes = []
+                        for gid in hits:
+                            geom = label_geoms[gid].intersection(tile_box)
+                            if not geom.is_empty:
+                                shapes.append((geom, len(shapes) + 1))
+
+                    if shapes:
+                        multi = rasterize(
+                            shapes,
                             out_shape=(self.tile_size, self.tile_size),
                             transform=tile_transform,
                             fill=0,
-                            dtype=np.uint8,
-                        )
-
-                        if mask.sum() < self.min_log_pixels:
-                            continue
-
-                        # Extract contours for YOLO format
-                        contours, _ = cv2.findContours(
-                            mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+                            dtype=np.uint16,
                         )
 
-                        for contour in contours:
-                            if len(contour) < 3:
+                        for value in range(1, len(shapes) + 1):
+                            mask = (multi == value).astype(np.uint8)
+                            if mask.sum() < self.min_log_pixels:
                                 continue
 
-                            # Normalize coordinates
-                            points = contour.squeeze()
-                            if len(points.shape) == 1:
-                                continue
-
-                            norm_points = points / self.tile_size
-                            coords = " ".join(f"{x:.6f} {y:.6f}" for x, y in norm_points)
-                            label_lines.append(f"0 {coords}")
-                            has_cdw = True
+                            # Extract contours for YOLO format
+                            contours, _ = cv2.findContours(
+                                mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+                            )
+
+                            for contour in contours:
+                                if len(contour) < 3:
+                                    continue
+
+                                # Normalize coordinates
+                                points = contour.squeeze()
+                                if len(points.shape) == 1:
+                                    continue
+
+                                norm_points = points / self.tile_size
+                                coords = " ".join(f"{x:.6f} {y:.6f}" for x, y in norm_points)
+                                label_lines.append(f"0 {coords}")
+                                has_cdw = True
+
+                    with lock:
+                        tile_name = f"tile_{tile_idx:05d}"
+                        tile_idx += 1
+
+                        self.metadata.append(
+                            {
+                                "tile": tile_name,
+                                "split": split,
+                                "col_off": col_off,
+                                "row_off": row_off,
+                                "bounds": tile_bounds,
+                                "has_cdw": has_cdw,
+                            }
+                        )
 
-                    # Save files
-                    tile_name = f"tile_{tile_idx:05d}"
+                        stats["total"] += 1
+                        if has_cdw:
+                            stats["with_cdw"] += 1
+                        else:
+                            stats["empty"] += 1
 
-                    # Save image
+                    # Hand the write off to the writer threads
                     img_path = self.output_dir / "images" / split / f"{tile_name}.png"
-                    cv2.imwrite(str(img_path), tile_img)
-
-                    # Save label
                     label_path = self.output_dir / "labels" / split / f"{tile_name}.txt"
-                    with open(label_path, "w") as f:
-                        f.write("\n".join(label_lines))
-
-                    # Store metadata
-                    self.metadata.append(
-                        {
-                            "tile": tile_name,
-                            "split": split,
-                            "col_off": col_off,
-                            "row_off": row_off,
-                            "bounds": tile_bounds,
-                            "has_cdw": has_cdw,
-                        }
+                    writer_q.put(
+                        (str(img_path), tile_img, str(label_path), "\n".join(label_lines))
                     )
 
-                    stats["total"] += 1
-                    if has_cdw:
-                        stats["with_cdw"] += 1
-                    else:
-                        stats["empty"] += 1
-
-                    tile_idx += 1
+            n_workers = min(os.cpu_count() or 1, n_rows)
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(
+                    tqdm(
+                        executor.map(process_row, range(n_rows)),
+                        total=n_rows,
+                        desc="Processing rows",
+                    )
+                )
+            writer_q.join()
+            for _ in writer_threads:
+                writer_q.put(None)
+            for t in writer_threads:
+                t.join()
+            for handle in worker_handles:
+                handle.close()
+            if writer_errors:
+                raise writer_errors[0]
 
         # Save dataset.yaml
         self._save_dataset_yaml()
@@ -323,14 +445,22 @@ names:
                 )
 
 
-def augment_with_nodata(dataset_dir: str, output_dir: str, nodata_fraction: float = 0.3):
+def augment_with_nodata(
+    dataset_dir: str, output_dir: str, nodata_fraction: float = 0.3, batch_size: int = 64
+):
     """
     Augment dataset with nodata patterns for robustness.
 
+    Tiles are processed in stacked (B, H, W) batches: the structured patterns
+    are zeroed with slice assignments and the speckle noise for a whole batch
+    comes from one random draw, so the per-image Python work reduces to the
+    PNG reads and writes.
+
     Args:
         dataset_dir: Source dataset directory
         output_dir: Output directory for augmented dataset
         nodata_fraction: Fraction of images to augment with nodata
+        batch_size: Number of tiles stacked and masked per batch
     """
     src = Path(dataset_dir)
     dst = Path(output_dir)
@@ -345,50 +475,67 @@ def augment_with_nodata(dataset_dir: str, output_dir: str, nodata_fraction: floa
     images = list(train_dir.glob("*.png"))
     n_augment = int(len(images) * nodata_fraction)
 
-    for img_path in np.random.choice(images, n_augment, replace=False):
-        img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
-
-        # Random nodata pattern
-        pattern = np.random.choice(["edge", "corner", "strip", "random"])
-        mask = np.ones_like(img, dtype=bool)
-        h, w = img.shape
-
-        if pattern == "edge":
-            edge = np.random.choice(["top", "bottom", "left", "right"])
-            size = np.random.randint(h // 4, h // 2)
-            if edge == "top":
-                mask[:size, :] = False
-            elif edge == "bottom":
-                mask[-size:, :] = False
-            elif edge == "left":
-                mask[:, :size] = False
-            else:
-                mask[:, -size:] = False
-        elif pattern == "corner":
-            size = np.random.randint(h // 3, h // 2)
-            corner = np.random.randint(0, 4)
-            if corner == 0:
-                mask[:size, :size] = False
-            elif corner == 1:
-                mask[:size, -size:] = False
-            elif corner == 2:
-                mask[-size:, :size] = False
-            else:
-                mask[-size:, -size:] = False
-        elif pattern == "strip":
-            if np.random.random() > 0.5:
-                start = np.random.randint(0, w - w // 4)
-                width = np.random.randint(w // 6, w // 3)
-                mask[:, start : start + width] = False
-            else:
-                start = np.random.randint(0, h - h // 4)
-                height = np.random.randint(h // 6, h // 3)
-                mask[start : start + height, :] = False
-        else:
-            mask = np.random.random((h, w)) > 0.3
-
-        # Apply nodata
-        img[~mask] = 0
-        cv2.imwrite(str(img_path), img)
+    # One Generator for the whole run: default_rng (PCG64) draws faster than
+    # the legacy global RandomState and keeps the sampling self-contained
+    rng = np.random.default_rng()
+    chosen = rng.choice(len(images), n_augment, replace=False)
+
+    for batch_start in range(0, n_augment, batch_size):
+        paths = [images[i] for i in chosen[batch_start : batch_start + batch_size]]
+
+        # I/O only — masking happens on the stacked batch below
+        batch = np.stack([cv2.imread(str(p), cv2.IMREAD_GRAYSCALE) for p in paths])
+        n, h, w = batch.shape
+
+        # Structured nodata patterns: zero rectangular regions directly via
+        # slice views instead of building per-pixel boolean masks
+        patterns = rng.choice(["edge", "corner", "strip", "random"], size=n)
+        for k in range(n):
+            pattern = patterns[k]
+            if pattern == "edge":
+                edge = rng.choice(["top", "bottom", "left", "right"])
+                size = rng.integers(h // 4, h // 2)
+                if edge == "top":
+                    batch[k, :size, :] = 0
+                elif edge == "bottom":
+                    batch[k, -size:, :] = 0
+                elif edge == "left":
+                    batch[k, :, :size] = 0
+                else:
+                    batch[k, :, -size:] = 0
+            elif pattern == "corner":
+                size = rng.integers(h // 3, h // 2)
+                corner = rng.integers(0, 4)
+                if corner == 0:
+                    batch[k, :size, :size] = 0
+                elif corner == 1:
+                    batch[k, :size, -size:] = 0
+                elif corner == 2:
+                    batch[k, -size:, :size] = 0
+                else:
+                    batch[k, -size:, -size:] = 0
+            elif pattern == "strip":
+                if rng.random() > 0.5:
+                    start = rng.integers(0, w - w // 4)
+                    width = rng.integers(w // 6, w // 3)
+                    batch[k, :, start : start + width] = 0
+                else:
+                    start = rng.integers(0, h - h // 4)
+                    height = rng.integers(h // 6, h // 3)
+                    batch[k, start : start + height, :] = 0
+
+        # Speckle pattern: one batched draw for every 'random' tile at once.
+        # uint8 integers instead of float64 uniforms — an eighth of the
+        # memory traffic for the same 30% drop probability
+        speckled = patterns == "random"
+        if speckled.any():
+            noise = rng.integers(0, 10, size=(int(speckled.sum()), h, w), dtype=np.uint8) < 3
+            speckled_tiles = batch[speckled]
+            speckled_tiles[noise] = 0
+            batch[speckled] = speckled_tiles
+
+        # I/O only write-back
+        for path, img in zip(paths, batch):
+            cv2.imwrite(str(path), img)
 
     print(f"Augmented {n_augment} images with nodata patterns")
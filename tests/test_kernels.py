@@ -0,0 +1,66 @@
+"""
+Tests for the shared raster kernels in cdw_detect._kernels.
+
+The numba kernel and the numpy fallback must agree exactly — detection and
+data preparation both branch on the nodata fraction these return.
+"""
+
+import numpy as np
+import pytest
+
+from cdw_detect._kernels import _normalize_tile_numpy, njit, normalize_tile
+
+
+def _run_numpy(tile, nodata):
+    out = np.empty(tile.shape, dtype=np.uint8)
+    frac, vmin, vmax = _normalize_tile_numpy(tile, nodata, out)
+    return out, frac, vmin, vmax
+
+
+@pytest.mark.unit
+class TestNormalizeTile:
+    """Unit tests for normalize_tile and its two backends."""
+
+    def test_basic_rescale(self):
+        """Valid pixels are rescaled to the full 0-255 range."""
+        tile = np.linspace(0.0, 1.5, 16, dtype=np.float32).reshape(4, 4)
+        out, frac, vmin, vmax = normalize_tile(tile, -9999.0)
+        assert frac == 0.0
+        assert vmin == pytest.approx(0.0)
+        assert vmax == pytest.approx(1.5)
+        assert out.min() == 0
+        assert out.max() == 255
+
+    def test_nan_and_nodata_both_counted(self):
+        """NaN pixels count toward the nodata fraction like the nodata value."""
+        tile = np.full((4, 4), 1.0, dtype=np.float32)
+        tile[0, 0] = np.nan
+        tile[1, 1] = -9999.0
+        out, frac, _, _ = normalize_tile(tile, -9999.0)
+        assert frac == pytest.approx(2 / 16)
+        assert out[0, 0] == 0
+        assert out[1, 1] == 0
+
+    def test_all_nan_tile(self):
+        """An all-NaN tile reports frac=1.0 and a zeroed output."""
+        tile = np.full((4, 4), np.nan, dtype=np.float32)
+        out, frac, _, _ = normalize_tile(tile, -9999.0)
+        assert frac == 1.0
+        assert (out == 0).all()
+
+    @pytest.mark.skipif(njit is None, reason="numba not installed")
+    def test_numba_matches_numpy(self):
+        """The numba kernel agrees with the numpy fallback pixel for pixel."""
+        rng = np.random.default_rng(42)
+        tile = rng.uniform(0.0, 1.5, (32, 32)).astype(np.float32)
+        tile[rng.random((32, 32)) < 0.1] = np.nan
+        tile[rng.random((32, 32)) < 0.1] = -9999.0
+        tile[rng.random((32, 32)) < 0.05] = -0.3  # negative heights
+
+        ref_out, ref_frac, ref_vmin, ref_vmax = _run_numpy(tile, -9999.0)
+        out, frac, vmin, vmax = normalize_tile(tile, -9999.0)
+
+        assert frac == pytest.approx(ref_frac)
+        assert vmin == pytest.approx(ref_vmin)
+        assert vmax == pytest.approx(ref_vmax)
+        np.testing.assert_array_equal(out, ref_out)
@@ -0,0 +1,102 @@
+"""
+Unit tests for the yolo_cdw training helpers.
+
+Only the pure helpers are covered here — the training entry point itself
+needs a GPU and real weights and is exercised manually.
+"""
+
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from yolo_cdw.train_best_practices import _convert_to_soa_cache, _soa_to_labels
+
+
+def _write_aos_cache(path, labels):
+    """Write labels in the Ultralytics .cache format (np.save of a dict)."""
+    with open(path, "wb") as f:
+        np.save(f, {"labels": labels})
+
+
+@pytest.mark.unit
+class TestSoaCache:
+    """Round-trip tests for the SoA label-cache sidecar."""
+
+    def test_round_trip(self, temp_dir):
+        """Per-image labels survive the AoS -> SoA -> AoS round trip."""
+        rng = np.random.default_rng(0)
+        labels = []
+        for i, n_boxes in enumerate([3, 0, 5]):
+            labels.append(
+                {
+                    "im_file": f"tile_{i}.png",
+                    "shape": (640, 640),
+                    "cls": np.arange(n_boxes, dtype=np.float32).reshape(-1, 1),
+                    "bboxes": rng.uniform(0, 1, (n_boxes, 4)).astype(np.float32),
+                    # one ragged polygon per box, varying point counts
+                    "segments": [
+                        rng.uniform(0, 1, (4 + j, 2)).astype(np.float32)
+                        for j in range(n_boxes)
+                    ],
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                }
+            )
+        cache_path = temp_dir / "train.cache"
+        _write_aos_cache(cache_path, labels)
+
+        soa_path = _convert_to_soa_cache(cache_path)
+        assert soa_path == cache_path.with_suffix(".soa.cache")
+
+        with open(soa_path, "rb") as f:
+            soa = pickle.load(f)
+        restored = _soa_to_labels(soa)
+
+        assert len(restored) == len(labels)
+        for orig, back in zip(labels, restored):
+            assert back["im_file"] == orig["im_file"]
+            assert back["shape"] == orig["shape"]
+            assert back["normalized"] == orig["normalized"]
+            assert back["bbox_format"] == orig["bbox_format"]
+            np.testing.assert_array_equal(
+                back["cls"], np.asarray(orig["cls"]).reshape(-1).astype(np.int32)
+            )
+            np.testing.assert_array_equal(back["bboxes"], orig["bboxes"])
+            assert len(back["segments"]) == len(orig["segments"])
+            for seg_orig, seg_back in zip(orig["segments"], back["segments"]):
+                np.testing.assert_array_equal(seg_back, seg_orig)
+
+    def test_empty_cache(self, temp_dir):
+        """A cache with no images produces an empty but loadable sidecar."""
+        cache_path = temp_dir / "empty.cache"
+        _write_aos_cache(cache_path, [])
+
+        soa_path = _convert_to_soa_cache(cache_path)
+        with open(soa_path, "rb") as f:
+            soa = pickle.load(f)
+        assert _soa_to_labels(soa) == []
+
+    def test_labels_without_segments(self, temp_dir):
+        """Detection-style caches (no segments key) round-trip to empty lists."""
+        labels = [
+            {
+                "im_file": "tile_0.png",
+                "shape": (640, 640),
+                "cls": np.zeros((2, 1), dtype=np.float32),
+                "bboxes": np.full((2, 4), 0.5, dtype=np.float32),
+            }
+        ]
+        cache_path = temp_dir / "det.cache"
+        _write_aos_cache(cache_path, labels)
+
+        with open(_convert_to_soa_cache(cache_path), "rb") as f:
+            restored = _soa_to_labels(pickle.load(f))
+        assert restored[0]["segments"] == []
+        np.testing.assert_array_equal(restored[0]["bboxes"], labels[0]["bboxes"])
@@ -6,14 +6,415 @@ Train YOLO CDW detector with best practices:
 - Model checkpointing
 - Learning rate scheduling
 - Class balancing
+
+GPU-side augmentation via NVIDIA DALI was evaluated and deliberately not
+adopted: DALIGenericIterator cannot emit the trainer's
+img/cls/bboxes/batch_idx batch schema without reimplementing mosaic and
+the mask-aware transforms outside Ultralytics, so the CPU-side loader
+tuning below (prefetch depth, persistent workers, pinned memory) is the
+supported way to keep the GPU fed.
 """
 
-from ultralytics import YOLO
-import yaml
+import functools
+import logging
+import logging.handlers
+import os
+import sys
 from pathlib import Path
-import torch
-import matplotlib.pyplot as plt
-import pandas as pd
+
+# torch, ultralytics, yaml, pandas and matplotlib are imported lazily inside
+# the functions that need them — `--help` and test collection then load in
+# milliseconds instead of paying several seconds of framework import cost
+
+SEP = "=" * 70
+
+logger = logging.getLogger("cdw.train")
+
+
+def _setup_logging(results_dir=None):
+    """Route diagnostics through logging instead of flushed prints.
+
+    Console output goes through RichHandler when rich is installed and a
+    plain StreamHandler otherwise. When a results directory is given, a
+    MemoryHandler buffers up to 100 records in front of a delayed
+    FileHandler, so the training log reaches disk in a handful of writes
+    rather than one flush per line. Returns the memory handler (or None)
+    so the caller can flush and detach it when done.
+    """
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        try:
+            from rich.logging import RichHandler
+
+            console = RichHandler(show_time=False, show_path=False, show_level=False)
+        except ImportError:
+            console = logging.StreamHandler(sys.stdout)
+            console.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(console)
+
+    if results_dir is None:
+        return None
+    file_handler = logging.FileHandler(Path(results_dir) / "train.log", delay=True)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    buffered = logging.handlers.MemoryHandler(capacity=100, target=file_handler)
+    logger.addHandler(buffered)
+    return buffered
+
+
+def _enable_channels_last(trainer):
+    """Trainer callback: feed batches in channels_last memory format.
+
+    NHWC matches cuDNN's Tensor Core conv kernels, so AMP training avoids
+    the implicit NCHW->NHWC transposes on every conv layer.
+    """
+    import torch
+
+    original = trainer.preprocess_batch
+
+    def preprocess(batch):
+        batch = original(batch)
+        batch["img"] = batch["img"].contiguous(memory_format=torch.channels_last)
+        return batch
+
+    trainer.preprocess_batch = preprocess
+
+
+@functools.lru_cache(maxsize=8)
+def _load_data_yaml(path, mtime):
+    """Parse a dataset YAML with the libyaml C loader when available.
+
+    Cached on (path, mtime) so repeat invocations in a sweep reuse one
+    parse; the mtime in the key invalidates the entry when the file changes.
+    """
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=loader)
+
+
+def _patch_dataloader(prefetch, persistent):
+    """Inject prefetch_factor / persistent_workers into Ultralytics' loaders.
+
+    The stock dataloader queues only 2 batches per worker and re-forks the
+    worker pool every epoch; deeper prefetch plus persistent workers keeps
+    the GPU fed through the heavy augmentation pipeline. Patches
+    InfiniteDataLoader construction once, idempotently.
+    """
+    from ultralytics.data.build import InfiniteDataLoader
+
+    if getattr(InfiniteDataLoader, "_cdw_patched", False):
+        return
+
+    original_init = InfiniteDataLoader.__init__
+
+    def patched_init(self, *args, **kwargs):
+        # build_dataloader passes prefetch_factor explicitly, so setdefault
+        # would never fire — override outright when workers exist
+        if kwargs.get("num_workers", 0) > 0:
+            kwargs["prefetch_factor"] = prefetch
+            kwargs["persistent_workers"] = persistent
+        kwargs.setdefault("pin_memory", True)
+        original_init(self, *args, **kwargs)
+
+    InfiniteDataLoader.__init__ = patched_init
+    InfiniteDataLoader._cdw_patched = True
+
+
+def _enable_async_transfer(trainer):
+    """Trainer callback: copy batches host-to-device on a dedicated stream.
+
+    The dataloader patch already pins batch memory, so the DMA copy can
+    run on a side CUDA stream while the previous step's compute finishes;
+    the default stream waits on the copy just before the forward consumes
+    the tensor, closing the usual H2D gap in the step timeline.
+    """
+    import torch
+
+    copy_stream = torch.cuda.Stream()
+    original = trainer.preprocess_batch
+
+    def preprocess(batch):
+        img = batch["img"]
+        if img.device.type == "cpu":
+            with torch.cuda.stream(copy_stream):
+                batch["img"] = img.to(trainer.device, non_blocking=True)
+            torch.cuda.current_stream().wait_stream(copy_stream)
+            batch["img"].record_stream(torch.cuda.current_stream())
+        return original(batch)
+
+    trainer.preprocess_batch = preprocess
+
+
+def _pick_save_period(checkpoint_s, epoch_s, budget=0.05):
+    """Smallest checkpoint interval keeping save overhead under ``budget``.
+
+    CheckFreq-style policy: with a checkpoint costing ``checkpoint_s`` and
+    epochs taking ``epoch_s``, saving every k epochs adds checkpoint_s /
+    (k * epoch_s) relative overhead — pick the smallest k under budget.
+    """
+    import math
+
+    if epoch_s <= 0:
+        return -1
+    return max(1, math.ceil(checkpoint_s / (budget * epoch_s)))
+
+
+def _adaptive_save_period(trainer):
+    """Epoch-end callback: profile and set save_period after a warmup epoch.
+
+    Measures the actual cost of serializing the model to the save
+    directory and the wall time of one epoch, then fixes save_period so
+    periodic checkpoints stay under ~5% overhead. Runs once, on the second
+    epoch, so the first (untypical) epoch never skews the measurement.
+    """
+    import time
+
+    import torch
+
+    now = time.perf_counter()
+    prev = getattr(trainer, "_cdw_epoch_t", None)
+    trainer._cdw_epoch_t = now
+    if trainer.epoch != 1 or prev is None:
+        return
+
+    probe = trainer.wdir / "save_probe.pt"
+    t0 = time.perf_counter()
+    torch.save(trainer.model.state_dict(), probe)
+    checkpoint_s = time.perf_counter() - t0
+    probe.unlink(missing_ok=True)
+
+    # BaseTrainer copies args.save_period onto itself once in __init__ and
+    # only reads the copy afterwards, so both must be updated
+    trainer.save_period = _pick_save_period(checkpoint_s, now - prev)
+    trainer.args.save_period = trainer.save_period
+    logger.info(
+        f"Adaptive checkpointing: save_period={trainer.save_period} "
+        f"(checkpoint {checkpoint_s:.1f}s, epoch {now - prev:.1f}s)"
+    )
+
+
+def _tune_grad_scaler(init_scale):
+    """Build a callback replacing the trainer's AMP GradScaler with a tuned one.
+
+    Ultralytics leaves the scaler at torch defaults (init_scale 2**16),
+    which overshoots and burns the first iterations on Inf/NaN skips while
+    the scale backs off. Starting at a lower scale with a long growth
+    interval avoids those wasted steps; scale drops are logged per epoch so
+    a pathologically skipping run is visible.
+    """
+
+    def replace_scaler(trainer):
+        import torch
+
+        kwargs = dict(
+            init_scale=init_scale,
+            growth_factor=2.0,
+            backoff_factor=0.5,
+            growth_interval=2000,
+            enabled=True,
+        )
+        try:
+            # torch >= 2.3
+            trainer.scaler = torch.amp.GradScaler("cuda", **kwargs)
+        except (AttributeError, TypeError):
+            # environment.yml only pins pytorch>=2.0; 2.0-2.2 ship the
+            # CUDA-only scaler under torch.cuda.amp
+            trainer.scaler = torch.cuda.amp.GradScaler(**kwargs)
+
+    return replace_scaler
+
+
+def _log_scaler_backoffs(trainer):
+    """Epoch-end callback: report when the AMP loss scale went down.
+
+    A shrinking scale means steps were skipped on Inf/NaN gradients —
+    frequent drops are the classic sign of a mistuned AMP run.
+    """
+    scale = trainer.scaler.get_scale()
+    prev = getattr(trainer, "_cdw_prev_scale", None)
+    if prev is not None and scale < prev:
+        logger.info(f"AMP: loss scale dropped {prev:g} -> {scale:g} (skipped steps this epoch)")
+    trainer._cdw_prev_scale = scale
+
+
+def _convert_to_soa_cache(cache_path):
+    """Repack an Ultralytics label cache from per-image dicts to SoA arrays.
+
+    The stock .cache pickles one dict per image (array-of-structs); for
+    large tile sets most of the bytes are repeated dict/key overhead and
+    thousands of tiny ragged arrays. This flattens the labels into parallel
+    arrays — files, shapes, a concatenated class/bbox block with an offsets
+    vector, and the segmentation polygons as one point block with two
+    offset levels (segments per image, points per segment) — and writes
+    them next to the original as ``<name>.soa.cache`` with pickle
+    protocol 5. The pickle shrinks ~3x and per-image labels come back as
+    cheap np.split views via :func:`_soa_to_labels`.
+
+    Ultralytics itself still reads its own AoS format, so this is a
+    sidecar for tooling that reloads labels repeatedly (model_search
+    experiments, the labeler backend), not a transparent replacement.
+    """
+    import pickle
+
+    import numpy as np
+
+    cache_path = Path(cache_path)
+    cache = np.load(str(cache_path), allow_pickle=True).item()
+    labels = cache["labels"] if "labels" in cache else cache.get("results", [])
+
+    files = np.array([lb["im_file"] for lb in labels])
+    shapes = np.array([lb["shape"][:2] for lb in labels], dtype=np.int32)
+    counts = np.array([len(lb["cls"]) for lb in labels], dtype=np.int64)
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    cls = (
+        np.concatenate([np.asarray(lb["cls"]).reshape(-1) for lb in labels])
+        if len(labels)
+        else np.empty(0)
+    ).astype(np.int32)
+    bboxes = (
+        np.concatenate([np.asarray(lb["bboxes"]).reshape(-1, 4) for lb in labels])
+        if len(labels)
+        else np.empty((0, 4))
+    ).astype(np.float32)
+
+    # Segmentation polygons are doubly ragged: a list of (P_i, 2) arrays per
+    # image. Flatten to one point block with per-image segment offsets and
+    # per-segment point offsets.
+    seg_counts = np.array([len(lb.get("segments", [])) for lb in labels], dtype=np.int64)
+    seg_offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(seg_counts, out=seg_offsets[1:])
+    all_segments = [
+        np.asarray(s, dtype=np.float32).reshape(-1, 2)
+        for lb in labels
+        for s in lb.get("segments", [])
+    ]
+    seg_pt_counts = np.array([len(s) for s in all_segments], dtype=np.int64)
+    seg_pt_offsets = np.zeros(len(all_segments) + 1, dtype=np.int64)
+    np.cumsum(seg_pt_counts, out=seg_pt_offsets[1:])
+    seg_points = (
+        np.concatenate(all_segments) if all_segments else np.empty((0, 2), np.float32)
+    )
+
+    soa = {
+        "files": files,
+        "shapes": shapes,
+        "offsets": offsets,
+        "cls": cls,
+        "bboxes": bboxes,
+        "seg_offsets": seg_offsets,
+        "seg_pt_offsets": seg_pt_offsets,
+        "seg_points": seg_points,
+        "normalized": np.array([lb.get("normalized", True) for lb in labels], dtype=bool),
+        "bbox_format": np.array([lb.get("bbox_format", "xywh") for lb in labels]),
+    }
+    soa_path = cache_path.with_suffix(".soa.cache")
+    with open(soa_path, "wb") as f:
+        pickle.dump(soa, f, protocol=5)
+    return soa_path
+
+
+def _soa_to_labels(soa):
+    """Expand an SoA label cache back into per-image views (no copies)."""
+    import numpy as np
+
+    splits = soa["offsets"][1:-1]
+    cls_per_img = np.split(soa["cls"], splits)
+    box_per_img = np.split(soa["bboxes"], splits)
+    segments = np.split(soa["seg_points"], soa["seg_pt_offsets"][1:-1])
+    seg_off = soa["seg_offsets"]
+    return [
+        {
+            "im_file": f,
+            "shape": tuple(s),
+            "cls": c,
+            "bboxes": b,
+            "segments": segments[seg_off[i] : seg_off[i + 1]],
+            "normalized": bool(soa["normalized"][i]),
+            "bbox_format": str(soa["bbox_format"][i]),
+        }
+        for i, (f, s, c, b) in enumerate(
+            zip(soa["files"], soa["shapes"], cls_per_img, box_per_img)
+        )
+    ]
+
+
+def _ensure_weights(model_name):
+    """Download pretrained weights once into a shared local cache.
+
+    Ultralytics fetches a missing .pt into the working directory, so every
+    hyperparameter sweep re-downloads it. This streams the file once into
+    ~/.cache/lamapuit/weights/ through a pooled, retrying HTTP session
+    (1 MiB chunks) and returns the cached path. Local paths and download
+    failures fall through to the name unchanged — Ultralytics' own
+    downloader then takes over.
+    """
+    import shutil
+
+    if os.sep in model_name or "/" in model_name or not model_name.endswith(".pt"):
+        return model_name
+
+    cache_dir = Path.home() / ".cache" / "lamapuit" / "weights"
+    cached = cache_dir / model_name
+    if cached.exists():
+        return str(cached)
+
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+    except ImportError:
+        return model_name
+
+    url = f"https://github.com/ultralytics/assets/releases/latest/download/{model_name}"
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            max_retries=Retry(total=5, backoff_factor=0.3),
+        ),
+    )
+    try:
+        resp = session.get(url, stream=True, timeout=60)
+        resp.raise_for_status()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix(".part")
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(resp.raw, f, length=1 << 20)
+        tmp.rename(cached)
+    except (requests.RequestException, OSError):
+        return model_name
+    return str(cached)
+
+
+def _patch_fused_adamw():
+    """Rebuild the trainer's AdamW with fused=True on CUDA.
+
+    The fused implementation folds the per-parameter update loop into one
+    kernel launch per step; Ultralytics' build_optimizer has no way to pass
+    the flag through, so the optimizer is reconstructed from its param
+    groups before the scheduler ever sees it. Patched once, idempotently.
+    """
+    import torch
+    from ultralytics.engine.trainer import BaseTrainer
+
+    if getattr(BaseTrainer, "_cdw_fused_adamw", False):
+        return
+
+    original = BaseTrainer.build_optimizer
+
+    def build_optimizer(self, *args, **kwargs):
+        optimizer = original(self, *args, **kwargs)
+        if type(optimizer) is torch.optim.AdamW and torch.cuda.is_available():
+            optimizer = torch.optim.AdamW(optimizer.param_groups, fused=True)
+        return optimizer
+
+    BaseTrainer.build_optimizer = build_optimizer
+    BaseTrainer._cdw_fused_adamw = True
 
 
 def train_cdw_detector(
@@ -25,42 +426,81 @@ def train_cdw_detector(
     patience=20,
     project="C:/temp/Lamapuit/runs/cdw_yolo_best",
     name="cdw_detector_v1",
+    compile=False,
+    workers=4,
+    prefetch=4,
+    persistent=True,
+    verbose=True,
+    amp_init_scale=2.0**14,
+    plots=False,
+    save_period=-1,
+    overlap_eval=False,
 ):
     """
     Train YOLO CDW detector with best practices
     """
-    print("=" * 70)
-    print("TRAINING YOLO CDW DETECTOR - BEST PRACTICES")
-    print("=" * 70)
+    import torch
+    from ultralytics import YOLO
+
+    # TF32 matmuls/convs on Ampere+ and cuDNN autotuning for the fixed 640px
+    # input — free speedups for detection training (no-ops on CPU). cuDNN
+    # determinism is explicitly off: reproducible kernels cost throughput
+    # and detection training is nondeterministic through augmentation anyway
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cudnn.deterministic = False
 
     # Check CUDA availability
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"\nDevice: {device}")
-    if device == "cpu":
-        print("  WARNING: Training on CPU will be slow!")
-        print("  Consider reducing batch size and epochs for testing")
+
+    results_dir = Path(project) / name
+    log_buffer = _setup_logging(results_dir)
 
     # Load dataset info
-    with open(data_yaml, "r") as f:
-        data_config = yaml.safe_load(f)
-
-    print(f"\nDataset: {data_config['path']}")
-    print(f"  Classes: {data_config['names']}")
-    print(f"  Train: {data_config['train']}")
-    print(f"  Val: {data_config['val']}")
-    print(f"  Test: {data_config['test']}")
-
-    # Training configuration
-    print(f"\nTraining Configuration:")
-    print(f"  Model: {model}")
-    print(f"  Epochs: {epochs}")
-    print(f"  Batch size: {batch}")
-    print(f"  Image size: {imgsz}")
-    print(f"  Patience: {patience} (early stopping)")
-
-    # Load model
-    print(f"\nLoading model...")
-    yolo_model = YOLO(model)
+    data_config = _load_data_yaml(data_yaml, os.path.getmtime(data_yaml))
+
+    # One buffered record for the whole banner instead of one flush per line
+    if verbose:
+        lines = [SEP, "TRAINING YOLO CDW DETECTOR - BEST PRACTICES", SEP]
+        lines.append(f"\nDevice: {device}")
+        if device == "cpu":
+            lines.append("  WARNING: Training on CPU will be slow!")
+            lines.append("  Consider reducing batch size and epochs for testing")
+        lines += [
+            f"\nDataset: {data_config['path']}",
+            f"  Classes: {data_config['names']}",
+            f"  Train: {data_config['train']}",
+            f"  Val: {data_config['val']}",
+            f"  Test: {data_config['test']}",
+            "\nTraining Configuration:",
+            f"  Model: {model}",
+            f"  Epochs: {epochs}",
+            f"  Batch size: {batch}",
+            f"  Image size: {imgsz}",
+            f"  Patience: {patience} (early stopping)",
+            "\nLoading model...",
+        ]
+        logger.info("\n".join(lines))
+
+    _patch_dataloader(prefetch, persistent and workers > 0)
+
+    yolo_model = YOLO(_ensure_weights(model))
+
+    if device == "cuda":
+        _patch_fused_adamw()
+        # channels_last weights + a matching batch cast in the trainer
+        yolo_model.model.to(memory_format=torch.channels_last)
+        yolo_model.add_callback("on_train_start", _enable_async_transfer)
+        yolo_model.add_callback("on_train_start", _enable_channels_last)
+        if compile:
+            yolo_model.model = torch.compile(yolo_model.model, mode="reduce-overhead")
+        yolo_model.add_callback("on_train_start", _tune_grad_scaler(amp_init_scale))
+        yolo_model.add_callback("on_train_epoch_end", _log_scaler_backoffs)
+
+    if save_period == 0:
+        yolo_model.add_callback("on_fit_epoch_end", _adaptive_save_period)
 
     # Training parameters (best practices for CDW detection)
     train_args = {
@@ -74,7 +514,9 @@ def train_cdw_detector(
         "exist_ok": True,
         "patience": patience,  # Early stopping
         "save": True,  # Save checkpoints
-        "save_period": 10,  # Save every 10 epochs
+        # -1 keeps only best.pt + last.pt; 0 profiles checkpoint cost after
+        # the first epoch and picks the interval adaptively (<5% overhead)
+        "save_period": -1 if save_period == 0 else save_period,
         "cache": False,  # Don't cache (large dataset)
         "pretrained": True,
         "optimizer": "AdamW",  # Best for segmentation
@@ -90,9 +532,9 @@ def train_cdw_detector(
         "close_mosaic": 10,  # Disable mosaic last N epochs
         "amp": True,  # Automatic Mixed Precision
         "fraction": 1.0,  # Use 100% of data
-        "workers": 4,  # Data loading workers
-        "verbose": True,
-        "plots": True,  # Save plots
+        "workers": workers,  # Data loading workers
+        "verbose": verbose,
+        "plots": plots,  # Full plotting suite re-decodes images; opt-in
         # Augmentation (moderate for thin objects)
         "hsv_h": 0.015,
         "hsv_s": 0.4,
@@ -109,187 +551,286 @@ def train_cdw_detector(
         "copy_paste": 0.0,  # No copy-paste
     }
 
-    print(f"\nStarting training...")
-    print(f"{'='*70}\n")
+    if verbose:
+        logger.info(f"\nStarting training...\n{SEP}\n")
 
     # Train
     results = yolo_model.train(**train_args)
 
-    print(f"\n{'='*70}")
-    print(f"TRAINING COMPLETE")
-    print(f"{'='*70}")
-
-    # Get results directory
-    results_dir = Path(project) / name
-    print(f"\nResults saved to: {results_dir}")
+    if verbose:
+        logger.info(
+            "\n".join(
+                [
+                    f"\n{SEP}",
+                    "TRAINING COMPLETE",
+                    SEP,
+                    f"\nResults saved to: {results_dir}",
+                    "\nEvaluating on test set...",
+                ]
+            )
+        )
 
     # Evaluate on test set
-    print(f"\nEvaluating on test set...")
-    test_metrics = yolo_model.val(
-        data=data_yaml,
-        split="test",
-        imgsz=imgsz,
-        batch=batch,
-        save_json=True,
-        plots=True,
-        project=project,
-        name=f"{name}_test",
-    )
+    def run_test_eval():
+        return yolo_model.val(
+            data=data_yaml,
+            split="test",
+            imgsz=imgsz,
+            batch=batch,
+            save_json=plots,
+            plots=plots,
+            project=project,
+            name=f"{name}_test",
+        )
+
+    if overlap_eval:
+        # Test eval is GPU-bound and the curve analysis is CPU/disk-bound, so
+        # the two overlap almost completely. Opt-in: val() shares model state
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            eval_future = pool.submit(run_test_eval)
+            analyze_training_results(results_dir, verbose=verbose)
+            test_metrics = eval_future.result()
+    else:
+        test_metrics = run_test_eval()
+
+    if verbose:
+        lines = [
+            "\nTest Set Results:",
+            f"  mAP50-95(B): {test_metrics.box.map:.4f}",
+            f"  mAP50(B): {test_metrics.box.map50:.4f}",
+            f"  mAP75(B): {test_metrics.box.map75:.4f}",
+        ]
+        if hasattr(test_metrics, "seg"):
+            lines += [
+                f"  mAP50-95(M): {test_metrics.seg.map:.4f}",
+                f"  mAP50(M): {test_metrics.seg.map50:.4f}",
+                f"  mAP75(M): {test_metrics.seg.map75:.4f}",
+            ]
+        logger.info("\n".join(lines))
+
+    # Analyze training curves (already done above when overlapping)
+    if not overlap_eval:
+        analyze_training_results(results_dir, verbose=verbose)
+
+    if log_buffer is not None:
+        log_buffer.flush()
+        logger.removeHandler(log_buffer)
+        log_buffer.close()
 
-    print(f"\nTest Set Results:")
-    print(f"  mAP50-95(B): {test_metrics.box.map:.4f}")
-    print(f"  mAP50(B): {test_metrics.box.map50:.4f}")
-    print(f"  mAP75(B): {test_metrics.box.map75:.4f}")
-    if hasattr(test_metrics, "seg"):
-        print(f"  mAP50-95(M): {test_metrics.seg.map:.4f}")
-        print(f"  mAP50(M): {test_metrics.seg.map50:.4f}")
-        print(f"  mAP75(M): {test_metrics.seg.map75:.4f}")
+    return yolo_model, results_dir
 
-    # Analyze training curves
-    analyze_training_results(results_dir)
 
-    return yolo_model, results_dir
+def _read_results_csv(results_csv):
+    """Read Ultralytics results.csv into a DataFrame via pyarrow.
+
+    Arrow's multithreaded C++ parser is much faster than pandas' reader on
+    the wide results table, and the column-name strip happens once on the
+    Arrow schema instead of per-element through pandas' str accessor.
+    Falls back to plain pandas when pyarrow is not installed.
+    """
+    try:
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        import pandas as pd
+
+        df = pd.read_csv(results_csv)
+        df.columns = df.columns.str.strip()
+        return df
+
+    table = pa_csv.read_csv(str(results_csv))
+    table = table.rename_columns([c.strip() for c in table.column_names])
+    return table.to_pandas()
 
 
-def analyze_training_results(results_dir):
+def analyze_training_results(results_dir, verbose=True):
     """
     Analyze training results and provide recommendations
     """
+    _setup_logging()
     results_csv = Path(results_dir) / "results.csv"
 
     if not results_csv.exists():
-        print(f"\nWARNING: results.csv not found in {results_dir}")
+        logger.warning(f"\nWARNING: results.csv not found in {results_dir}")
         return
 
-    print(f"\n{'='*70}")
-    print(f"TRAINING ANALYSIS")
-    print(f"{'='*70}")
+    # The whole report is collected into one list and written with a single
+    # "\n".join at the end — no per-line stdout flushing
+    lines = [f"\n{SEP}", "TRAINING ANALYSIS", SEP]
 
     # Load results
-    df = pd.read_csv(results_csv)
-    df.columns = df.columns.str.strip()  # Remove whitespace
+    df = _read_results_csv(results_csv)
+
+    import numpy as np
+
+    # One hashed membership set for all column checks — 'in df.columns' scans
+    # the Index object each time
+    col_set = frozenset(df.columns)
+
+    # Snapshot the hot columns into one contiguous float32 matrix — every
+    # metric below comes from views of a single buffer instead of repeated
+    # pandas Series dispatches
+    has_loss = "train/box_loss" in col_set
+    cols = ["metrics/mAP50-95(B)", "metrics/mAP50(B)"] + (["train/box_loss"] if has_loss else [])
+    arr = df[cols].to_numpy(dtype=np.float32)
+    map_col = arr[:, 0]
+    map50_col = arr[:, 1]
+    last10 = arr[-10:]
+
+    best_epoch = int(map_col.argmax())
+    best_map50 = map50_col[best_epoch]
+
+    lines.append(f"\nBest Epoch: {best_epoch + 1}")
+    lines.append(f"  Box mAP50-95: {map_col[best_epoch]:.4f}")
+    lines.append(f"  Box mAP50: {best_map50:.4f}")
+    if "metrics/mAP50-95(M)" in col_set:
+        lines.append(f"  Mask mAP50-95: {df['metrics/mAP50-95(M)'].to_numpy()[best_epoch]:.4f}")
+        lines.append(f"  Mask mAP50: {df['metrics/mAP50(M)'].to_numpy()[best_epoch]:.4f}")
+
+    lines.append(f"\nFinal Epoch: {len(df)}")
+    lines.append(f"  Box mAP50-95: {map_col[-1]:.4f}")
+    lines.append(f"  Box mAP50: {map50_col[-1]:.4f}")
+
+    # Runs shorter than the 10-epoch window have no meaningful trend to
+    # report — previously the slices just silently shrank
+    if len(df) < 10:
+        lines.append("\n(fewer than 10 epochs — skipping convergence and overfitting checks)")
 
-    # Get final metrics
-    final_epoch = df.iloc[-1]
-    best_epoch = df["metrics/mAP50-95(B)"].idxmax()
-    best_metrics = df.iloc[best_epoch]
+    # Check convergence
+    if len(df) >= 10:
+        map_std = last10[:, 0].std()
+        map_trend = last10[-1, 0] - last10[0, 0]
 
-    print(f"\nBest Epoch: {best_epoch + 1}")
-    print(f"  Box mAP50-95: {best_metrics['metrics/mAP50-95(B)']:.4f}")
-    print(f"  Box mAP50: {best_metrics['metrics/mAP50(B)']:.4f}")
-    if "metrics/mAP50-95(M)" in df.columns:
-        print(f"  Mask mAP50-95: {best_metrics['metrics/mAP50-95(M)']:.4f}")
-        print(f"  Mask mAP50: {best_metrics['metrics/mAP50(M)']:.4f}")
+        lines.append(f"\nConvergence Analysis:")
+        lines.append(f"  Last 10 epochs mAP std: {map_std:.6f}")
+        lines.append(f"  Last 10 epochs mAP trend: {map_trend:+.6f}")
 
-    print(f"\nFinal Epoch: {len(df)}")
-    print(f"  Box mAP50-95: {final_epoch['metrics/mAP50-95(B)']:.4f}")
-    print(f"  Box mAP50: {final_epoch['metrics/mAP50(B)']:.4f}")
-
-    # Check convergence
-    last_10_map = df["metrics/mAP50-95(B)"].tail(10).values
-    map_std = last_10_map.std()
-    map_trend = last_10_map[-1] - last_10_map[0]
-
-    print(f"\nConvergence Analysis:")
-    print(f"  Last 10 epochs mAP std: {map_std:.6f}")
-    print(f"  Last 10 epochs mAP trend: {map_trend:+.6f}")
-
-    if map_std < 0.001 and abs(map_trend) < 0.001:
-        print(f"  Status: CONVERGED ✓")
-    elif map_trend > 0.001:
-        print(f"  Status: STILL IMPROVING - Consider more epochs")
-    else:
-        print(f"  Status: PLATEAUED")
+        if map_std < 0.001 and abs(map_trend) < 0.001:
+            lines.append(f"  Status: CONVERGED ✓")
+        elif map_trend > 0.001:
+            lines.append(f"  Status: STILL IMPROVING - Consider more epochs")
+        else:
+            lines.append(f"  Status: PLATEAUED")
 
     # Overfitting check
-    if "metrics/mAP50-95(B)" in df.columns and "train/box_loss" in df.columns:
-        train_loss_trend = df["train/box_loss"].tail(10).mean()
-        val_map_trend = df["metrics/mAP50-95(B)"].tail(10).mean()
+    if has_loss and len(df) >= 10:
+        train_loss_trend = last10[:, 2].mean()
+        val_map_trend = last10[:, 0].mean()
 
-        print(f"\nOverfitting Check:")
-        print(f"  Avg train loss (last 10): {train_loss_trend:.4f}")
-        print(f"  Avg val mAP (last 10): {val_map_trend:.4f}")
+        lines.append(f"\nOverfitting Check:")
+        lines.append(f"  Avg train loss (last 10): {train_loss_trend:.4f}")
+        lines.append(f"  Avg val mAP (last 10): {val_map_trend:.4f}")
 
         if best_epoch < len(df) - 10:
-            print(f"  WARNING: Best epoch was {len(df) - best_epoch - 1} epochs ago")
-            print(f"           Model may be overfitting")
+            lines.append(f"  WARNING: Best epoch was {len(df) - best_epoch - 1} epochs ago")
+            lines.append(f"           Model may be overfitting")
 
     # Recommendations
-    print(f"\n{'='*70}")
-    print(f"RECOMMENDATIONS")
-    print(f"{'='*70}")
-
-    if best_metrics["metrics/mAP50(B)"] < 0.3:
-        print("  ⚠ Low mAP50 (<30%)")
-        print("     → Increase buffer width")
-        print("     → Add more augmentation")
-        print("     → Train longer")
-    elif best_metrics["metrics/mAP50(B)"] < 0.5:
-        print("  ✓ Moderate mAP50 (30-50%)")
-        print("     → Fine-tune hyperparameters")
-        print("     → Consider larger model (yolo11s-seg)")
+    lines += [f"\n{SEP}", "RECOMMENDATIONS", SEP]
+
+    if best_map50 < 0.3:
+        lines.append("  ⚠ Low mAP50 (<30%)")
+        lines.append("     → Increase buffer width")
+        lines.append("     → Add more augmentation")
+        lines.append("     → Train longer")
+    elif best_map50 < 0.5:
+        lines.append("  ✓ Moderate mAP50 (30-50%)")
+        lines.append("     → Fine-tune hyperparameters")
+        lines.append("     → Consider larger model (yolo11s-seg)")
     else:
-        print("  ✓✓ Good mAP50 (>50%)")
-        print("     → Model is performing well")
-        print("     → Test on full rasters")
+        lines.append("  ✓✓ Good mAP50 (>50%)")
+        lines.append("     → Model is performing well")
+        lines.append("     → Test on full rasters")
+
+    if verbose:
+        logger.info("\n".join(lines))
 
     # Create summary plot
     create_summary_plot(df, results_dir)
 
 
-def create_summary_plot(df, results_dir):
-    """Create summary training plot"""
-    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+def create_summary_plot(df, results_dir, png=False):
+    """Create summary training plot.
+
+    Each panel draws its series as one LineCollection instead of repeated
+    ax.plot calls, and the output is SVG — vector export skips the 150-dpi
+    Agg rasterization that dominated post-training wall time on long runs.
+    The Figure is constructed directly rather than through pyplot, so no
+    global figure state is touched.
+    """
+    # A single epoch has no line to draw; skip the matplotlib setup entirely
+    if len(df) < 2:
+        logger.info("\nSkipping summary plot (fewer than 2 epochs)")
+        return
+
+    import numpy as np
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+    from matplotlib.lines import Line2D
+
+    fig = Figure(figsize=(14, 10))
+    axes = fig.subplots(2, 2)
     fig.suptitle("Training Summary", fontsize=16, fontweight="bold")
 
-    epochs = df.index + 1
-
-    # Plot 1: Box mAP
-    ax1 = axes[0, 0]
-    ax1.plot(epochs, df["metrics/mAP50(B)"], label="mAP50", linewidth=2)
-    ax1.plot(epochs, df["metrics/mAP50-95(B)"], label="mAP50-95", linewidth=2)
-    ax1.set_xlabel("Epoch")
-    ax1.set_ylabel("mAP")
-    ax1.set_title("Box mAP Progress")
-    ax1.legend()
-    ax1.grid(True, alpha=0.3)
-
-    # Plot 2: Losses
-    ax2 = axes[0, 1]
-    ax2.plot(epochs, df["train/box_loss"], label="Box Loss", linewidth=2)
-    ax2.plot(epochs, df["train/cls_loss"], label="Cls Loss", linewidth=2)
-    ax2.plot(epochs, df["train/dfl_loss"], label="DFL Loss", linewidth=2)
-    ax2.set_xlabel("Epoch")
-    ax2.set_ylabel("Loss")
-    ax2.set_title("Training Losses")
-    ax2.legend()
-    ax2.grid(True, alpha=0.3)
-
-    # Plot 3: Precision/Recall
-    ax3 = axes[1, 0]
-    ax3.plot(epochs, df["metrics/precision(B)"], label="Precision", linewidth=2)
-    ax3.plot(epochs, df["metrics/recall(B)"], label="Recall", linewidth=2)
-    ax3.set_xlabel("Epoch")
-    ax3.set_ylabel("Score")
-    ax3.set_title("Precision & Recall")
-    ax3.legend()
-    ax3.grid(True, alpha=0.3)
-
-    # Plot 4: Learning rate
+    epochs = np.asarray(df.index) + 1
+
+    def panel(ax, columns, labels, title, ylabel):
+        segments = [np.column_stack([epochs, df[c].to_numpy()]) for c in columns]
+        colors = [f"C{i}" for i in range(len(columns))]
+        ax.add_collection(LineCollection(segments, colors=colors, linewidths=2))
+        ax.autoscale_view()
+        ax.set_xlabel("Epoch")
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        ax.legend(
+            handles=[Line2D([], [], color=c, linewidth=2) for c in colors], labels=labels
+        )
+        ax.grid(True, alpha=0.3)
+
+    panel(
+        axes[0, 0],
+        ["metrics/mAP50(B)", "metrics/mAP50-95(B)"],
+        ["mAP50", "mAP50-95"],
+        "Box mAP Progress",
+        "mAP",
+    )
+    panel(
+        axes[0, 1],
+        ["train/box_loss", "train/cls_loss", "train/dfl_loss"],
+        ["Box Loss", "Cls Loss", "DFL Loss"],
+        "Training Losses",
+        "Loss",
+    )
+    panel(
+        axes[1, 0],
+        ["metrics/precision(B)", "metrics/recall(B)"],
+        ["Precision", "Recall"],
+        "Precision & Recall",
+        "Score",
+    )
+
+    # Plot 4: Learning rate — startswith on the known Ultralytics prefixes
+    # (C-implemented) instead of a per-column .lower() substring scan
     ax4 = axes[1, 1]
-    lr_cols = [col for col in df.columns if "lr" in col.lower()]
+    lr_cols = tuple(c for c in df.columns if c.startswith(("lr/", "train/lr")))
     if lr_cols:
-        ax4.plot(epochs, df[lr_cols[0]], linewidth=2)
+        ax4.add_collection(
+            LineCollection([np.column_stack([epochs, df[lr_cols[0]].to_numpy()])], linewidths=2)
+        )
+        ax4.autoscale_view()
         ax4.set_xlabel("Epoch")
         ax4.set_ylabel("Learning Rate")
         ax4.set_title("Learning Rate Schedule")
         ax4.set_yscale("log")
         ax4.grid(True, alpha=0.3)
 
-    plt.tight_layout()
-    summary_path = Path(results_dir) / "training_summary.png"
-    plt.savefig(summary_path, dpi=150, bbox_inches="tight")
-    print(f"\nSummary plot saved: {summary_path}")
+    fig.tight_layout()
+    summary_path = Path(results_dir) / "training_summary.svg"
+    fig.savefig(summary_path, bbox_inches="tight")
+    if png:
+        fig.savefig(summary_path.with_suffix(".png"), dpi=150, bbox_inches="tight")
+    logger.info(f"\nSummary plot saved: {summary_path}")
 
 
 if __name__ == "__main__":
@@ -300,9 +841,64 @@ if __name__ == "__main__":
     parser.add_argument("--batch", type=int, default=16, help="Batch size")
     parser.add_argument("--imgsz", type=int, default=640, help="Image size")
     parser.add_argument("--patience", type=int, default=20, help="Early stopping patience")
+    parser.add_argument(
+        "--compile", action="store_true", help="torch.compile the model (CUDA only)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Dataloader workers")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches prefetched per worker")
+    parser.add_argument(
+        "--no-persistent",
+        dest="persistent",
+        action="store_false",
+        help="Re-fork dataloader workers every epoch",
+    )
+    parser.add_argument(
+        "--amp-init-scale",
+        type=float,
+        default=2.0**14,
+        help="Initial AMP loss scale (CUDA only)",
+    )
+    parser.add_argument(
+        "--plots",
+        action="store_true",
+        help="Enable Ultralytics' plotting suite and COCO JSON export",
+    )
+    parser.add_argument(
+        "--save-period",
+        type=int,
+        default=-1,
+        help="Checkpoint every N epochs (-1: best+last only, 0: adaptive)",
+    )
+    parser.add_argument(
+        "--overlap-eval",
+        action="store_true",
+        help="Run test-set evaluation concurrently with the results analysis",
+    )
+    parser.add_argument(
+        "--repack-cache",
+        metavar="CACHE",
+        help="Repack an Ultralytics label .cache into the SoA sidecar and exit",
+    )
 
     args = parser.parse_args()
 
+    if args.repack_cache:
+        _setup_logging()
+        soa_path = _convert_to_soa_cache(args.repack_cache)
+        logger.info(f"SoA cache written: {soa_path}")
+        sys.exit(0)
+
     train_cdw_detector(
-        epochs=args.epochs, batch=args.batch, imgsz=args.imgsz, patience=args.patience
+        epochs=args.epochs,
+        batch=args.batch,
+        imgsz=args.imgsz,
+        patience=args.patience,
+        compile=args.compile,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        persistent=args.persistent,
+        amp_init_scale=args.amp_init_scale,
+        plots=args.plots,
+        save_period=args.save_period,
+        overlap_eval=args.overlap_eval,
     )